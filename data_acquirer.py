@@ -1,13 +1,161 @@
 # data_acquirer.py
 
+import functools
+import numpy as np
 import pandas as pd
 from polygon import RESTClient
 from polygon.exceptions import BadResponse
 import logging
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Initial capacity for the streamed aggregate arrays; doubled when full.
+_INITIAL_AGG_CAPACITY = 16384
+
+# (column name, dtype) layout for the streamed aggregate buffer.
+# OHLC prices use float32: ~1.2e-7 relative error, plenty for return
+# calculations, and half the memory traffic of every downstream vectorized
+# pass. Note the precision is relative — very high-priced tickers (e.g.
+# BRK.A near $700k) round to the nearest few cents. Volume and vwap stay
+# float64 (volume exceeds float32's exact-integer range on heavy days).
+_AGG_COLUMNS = (
+    ('timestamp', 'int64'),
+    ('open', 'float32'),
+    ('high', 'float32'),
+    ('low', 'float32'),
+    ('close', 'float32'),
+    ('volume', 'float64'),
+    ('vwap', 'float64'),
+    ('transactions', 'float64'),
+)
+
+
+def _new_agg_arrays(capacity: int) -> dict:
+    """Allocates an empty typed-array buffer for streamed aggregates."""
+    arrs = {name: np.empty(capacity, dtype=dtype) for name, dtype in _AGG_COLUMNS}
+    arrs['n'] = 0
+    arrs['cap'] = capacity
+    # Whether the feed carries the optional fields; probed on the first agg
+    # so the hot loop stays plain attribute access, no getattr per row.
+    arrs['has_vwap'] = False
+    arrs['has_transactions'] = False
+    return arrs
+
+
+def _append_agg(arrs: dict, agg):
+    """Appends one Aggregate to the buffer, doubling capacity when full."""
+    i = arrs['n']
+    if i == arrs['cap']:
+        new_cap = arrs['cap'] * 2
+        for name, dtype in _AGG_COLUMNS:
+            grown = np.empty(new_cap, dtype=dtype)
+            grown[:i] = arrs[name]
+            arrs[name] = grown
+        arrs['cap'] = new_cap
+    arrs['timestamp'][i] = agg.timestamp  # Polygon timestamps are UNIX ms (UTC)
+    arrs['open'][i] = agg.open
+    arrs['high'][i] = agg.high
+    arrs['low'][i] = agg.low
+    arrs['close'][i] = agg.close
+    arrs['volume'][i] = agg.volume
+    # vwap/transactions might not always be present; probe once on the first
+    # agg and branch on the stored result instead of a getattr per row
+    if i == 0:
+        arrs['has_vwap'] = getattr(agg, 'vwap', None) is not None
+        arrs['has_transactions'] = getattr(agg, 'transactions', None) is not None
+    if arrs['has_vwap']:
+        vwap = agg.vwap
+        arrs['vwap'][i] = vwap if vwap is not None else np.nan
+    else:
+        arrs['vwap'][i] = np.nan
+    if arrs['has_transactions']:
+        transactions = agg.transactions
+        arrs['transactions'][i] = transactions if transactions is not None else np.nan
+    else:
+        arrs['transactions'][i] = np.nan
+    arrs['n'] = i + 1
+
+
+# Date ranges longer than this are split into sub-ranges fetched in parallel
+_MAX_SHARD_DAYS = 365
+
+# Concurrent sub-range fetches per ticker; keep modest for Polygon rate limits
+_MAX_FETCH_WORKERS = 4
+
+
+def _shard_dates(start_date: str, end_date: str, max_days: int = _MAX_SHARD_DAYS) -> list[tuple[str, str]]:
+    """Splits [start_date, end_date] into inclusive sub-ranges of at most max_days."""
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    one_day = timedelta(days=1)
+    shards = []
+    while start <= end:
+        stop = min(start + timedelta(days=max_days - 1), end)
+        shards.append((start.isoformat(), stop.isoformat()))
+        start = stop + one_day
+    return shards
+
+
+@functools.lru_cache(maxsize=4)
+def _get_client(api_key: str) -> RESTClient:
+    """
+    Returns a cached RESTClient for the given API key.
+
+    Constructing a client per fetch forces a fresh TCP+TLS handshake per
+    ticker; caching it reuses the underlying urllib3 connection pool (which
+    is thread-safe and keeps connections alive) across calls and threads.
+    """
+    return RESTClient(api_key, num_pools=16)
+
+
+def _fetch_range(client: RESTClient, ticker: str, multiplier: int, timespan: str,
+                 start_date: str, end_date: str, adjusted: bool) -> pd.DataFrame | None:
+    """
+    Fetches one date sub-range of aggregates and returns it as a DataFrame,
+    or None if the range is empty.
+    """
+    # Polygon's list_aggs can fetch a wide range of data.
+    # For very long date ranges, it might return a generator that needs iteration.
+    # The client library handles pagination for list_aggs if you iterate over it.
+    aggs_iterator = client.list_aggs(
+        ticker=ticker,
+        multiplier=multiplier,
+        timespan=timespan,
+        from_=start_date,
+        to=end_date,
+        adjusted=adjusted,
+        sort="asc",  # Ensure data is sorted chronologically
+        limit=50000  # Max limit per request; the client handles pagination if more data exists
+    )
+
+    # Stream the iterator once into typed arrays that double on overflow.
+    # This avoids materializing a Python list of Aggregate objects just to
+    # check emptiness, then traversing it a second time for the DataFrame.
+    arrs = _new_agg_arrays(_INITIAL_AGG_CAPACITY)
+    for agg in aggs_iterator:
+        _append_agg(arrs, agg)
+
+    n = arrs['n']
+    if n == 0:
+        return None
+
+    df = pd.DataFrame({
+        'open': arrs['open'][:n],
+        'high': arrs['high'][:n],
+        'low': arrs['low'][:n],
+        'close': arrs['close'][:n],
+        'volume': arrs['volume'][:n],
+        'vwap': arrs['vwap'][:n],
+        'transactions': arrs['transactions'][:n],
+    }, index=pd.to_datetime(arrs['timestamp'][:n], unit='ms', utc=True),
+        copy=False)  # columns are already typed arrays; wrap, don't copy
+    df.index.name = 'timestamp'
+    return df
+
 
 def fetch_stock_data(api_key: str, ticker: str, start_date: str, end_date: str,
                        multiplier: int = 1, timespan: str = "day", adjusted: bool = True) -> pd.DataFrame | None:
@@ -28,62 +176,57 @@ def fetch_stock_data(api_key: str, ticker: str, start_date: str, end_date: str,
                              The DataFrame will have a 'timestamp' (datetime) index and columns:
                              ['open', 'high', 'low', 'close', 'volume', 'vwap', 'transactions'].
     """
-    logging.info(f"Attempting to fetch data for {ticker} from {start_date} to {end_date} (Adjusted: {adjusted}).")
+    logger.info(f"Attempting to fetch data for {ticker} from {start_date} to {end_date} (Adjusted: {adjusted}).")
 
     try:
-        client = RESTClient(api_key)
-        
-        # Polygon's list_aggs can fetch a wide range of data.
-        # For very long date ranges, it might return a generator that needs iteration.
-        # The client library handles pagination for list_aggs if you iterate over it.
-        aggs_iterator = client.list_aggs(
-            ticker=ticker,
-            multiplier=multiplier,
-            timespan=timespan,
-            from_=start_date,
-            to=end_date,
-            adjusted=adjusted,
-            sort="asc",  # Ensure data is sorted chronologically
-            limit=50000  # Max limit per request; the client handles pagination if more data exists
-        )
-        
-        aggs_list = list(aggs_iterator) # Convert iterator to list to check if empty
-
-        if not aggs_list:
-            logging.warning(f"No data found for {ticker} from {start_date} to {end_date}.")
+        client = _get_client(api_key)
+
+        # Long ranges are split into sub-ranges fetched on a small thread
+        # pool: list_aggs paginates its round trips sequentially, so sharding
+        # turns sum-of-latencies into roughly max-of-latencies. The pooled
+        # client's connection pool is thread-safe and shared by the workers.
+        # Only multiplier-1 requests shard: Polygon anchors custom aggregate
+        # windows (e.g. 5/day) to the request's from_ date, so splitting the
+        # range would regroup the bars at every shard boundary.
+        if multiplier == 1:
+            shards = _shard_dates(start_date, end_date)
+        else:
+            shards = [(start_date, end_date)] if start_date <= end_date else []
+        if not shards:
+            # Reversed range: surface it like any other empty result instead
+            # of letting an empty thread pool raise
+            logger.warning(f"No data found for {ticker} from {start_date} to {end_date}.")
             return None
+        if len(shards) == 1:
+            dfs = [_fetch_range(client, ticker, multiplier, timespan,
+                                start_date, end_date, adjusted)]
+        else:
+            logger.info(f"Fetching {ticker} across {len(shards)} date sub-ranges in parallel.")
+            with ThreadPoolExecutor(max_workers=min(_MAX_FETCH_WORKERS, len(shards))) as executor:
+                dfs = list(executor.map(
+                    lambda shard: _fetch_range(client, ticker, multiplier, timespan,
+                                               shard[0], shard[1], adjusted),
+                    shards))
 
-        # Convert the list of Aggregate objects to a Pandas DataFrame
-        df = pd.DataFrame([{
-            'timestamp': pd.to_datetime(agg.timestamp, unit='ms', utc=True), # Polygon timestamps are UNIX ms (UTC)
-            'open': agg.open,
-            'high': agg.high,
-            'low': agg.low,
-            'close': agg.close,
-            'volume': agg.volume,
-            'vwap': getattr(agg, 'vwap', None), # vwap might not always be present
-            'transactions': getattr(agg, 'transactions', None) # transactions might not always be present
-        } for agg in aggs_list])
-
-        if df.empty:
-            logging.warning(f"DataFrame is empty after processing aggregates for {ticker}.")
+        dfs = [df for df in dfs if df is not None]
+        if not dfs:
+            logger.warning(f"No data found for {ticker} from {start_date} to {end_date}.")
             return None
 
-        # Set timestamp as index
-        df = df.set_index('timestamp')
-        
-        logging.info(f"Successfully fetched {len(df)} data points for {ticker}.")
+        df = dfs[0] if len(dfs) == 1 else pd.concat(dfs).sort_index()
+
+        logger.info(f"Successfully fetched {len(df)} data points for {ticker}.")
         return df
 
     except BadResponse as e:
-        logging.error(f"Polygon API BadResponse for {ticker}: {e}. Check your API key and request parameters.")
-        logging.error(f"Response status: {e.status}, Response text: {e.response.text if e.response else 'N/A'}")
+        logger.error(f"Polygon API BadResponse for {ticker}: {e}. Check your API key and request parameters.")
+        logger.error(f"Response status: {e.status}, Response text: {e.response.text if e.response else 'N/A'}")
         return None
     except ConnectionError as e:
-        logging.error(f"Connection error while fetching data for {ticker}: {e}")
+        logger.error(f"Connection error while fetching data for {ticker}: {e}")
         return None
     except Exception as e:
-        logging.error(f"An unexpected error occurred while fetching data for {ticker}: {e}", exc_info=True)
+        logger.error(f"An unexpected error occurred while fetching data for {ticker}: {e}", exc_info=True)
         return None
 
 if __name__ == '__main__':
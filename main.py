@@ -1,77 +1,91 @@
 # main.py
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from config import POLYGON_API_KEY, DEFAULT_TICKER, DEFAULT_START_DATE, DEFAULT_END_DATE
 from data_acquirer import fetch_stock_data
-from data_processor import preprocess_data, save_data_to_csv, load_data_from_csv
+from data_processor import preprocess_data, save_data, load_data
 
-# Configure basic logging for the main script
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+# Configure basic logging for the main script; include the thread name since
+# pipelines for different tickers run concurrently.
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(threadName)s - %(module)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Cap concurrent pipelines so we stay within Polygon's rate limits
+MAX_PIPELINE_WORKERS = 8
 
 def run_pipeline(ticker: str, start_date: str, end_date: str, api_key: str):
     """
     Runs the data acquisition and processing pipeline for a given stock.
     """
-    logging.info(f"--- Starting pipeline for {ticker} ---")
+    logger.info(f"--- Starting pipeline for {ticker} ---")
 
     # Step 1: Data Acquisition
-    logging.info(f"Acquiring data for {ticker} from {start_date} to {end_date}...")
+    logger.info(f"Acquiring data for {ticker} from {start_date} to {end_date}...")
     raw_df = fetch_stock_data(api_key, ticker, start_date, end_date, adjusted=True)
 
     if raw_df is None or raw_df.empty:
-        logging.error(f"Failed to acquire data for {ticker}. Pipeline terminated for this ticker.")
+        logger.error(f"Failed to acquire data for {ticker}. Pipeline terminated for this ticker.")
         return
     
-    logging.info(f"Successfully acquired {len(raw_df)} rows of raw data for {ticker}.")
-    logging.debug(f"Raw data head for {ticker}:\n{raw_df.head()}")
+    logger.info(f"Successfully acquired {len(raw_df)} rows of raw data for {ticker}.")
+    # Guard DEBUG logs that format a DataFrame: head()'s repr is expensive
+    # and would otherwise be built even when DEBUG is disabled.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw data head for %s:\n%s", ticker, raw_df.head())
 
     # Step 2: Data Preprocessing
-    logging.info(f"Preprocessing data for {ticker}...")
-    processed_df = preprocess_data(raw_df, ticker=ticker)
+    # The raw frame is not needed after this point, so let preprocess_data
+    # work on it in place rather than duplicating every column.
+    logger.info(f"Preprocessing data for {ticker}...")
+    processed_df = preprocess_data(raw_df, ticker=ticker, inplace=True)
+    raw_df = None  # Release the reference; processed_df owns the frame now
 
     if processed_df is None or processed_df.empty:
-        logging.error(f"Failed to preprocess data for {ticker}. Pipeline terminated for this ticker.")
+        logger.error(f"Failed to preprocess data for {ticker}. Pipeline terminated for this ticker.")
         return
 
-    logging.info(f"Successfully preprocessed data for {ticker}. Shape: {processed_df.shape}")
-    logging.debug(f"Processed data head for {ticker}:\n{processed_df.head()}")
+    logger.info(f"Successfully preprocessed data for {ticker}. Shape: {processed_df.shape}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Processed data head for %s:\n%s", ticker, processed_df.head())
 
     # Step 3: Data Storage
     # Define a filename for the processed data
-    # Make sure the 'data' subdirectory exists or is created by save_data_to_csv
-    output_filename = f"{ticker}_daily_adjusted_processed.csv"
-    logging.info(f"Saving processed data for {ticker} to {output_filename}...")
-    
-    if save_data_to_csv(processed_df, output_filename, directory="data"):
-        logging.info(f"Successfully saved processed data for {ticker}.")
+    # Make sure the 'data' subdirectory exists or is created by save_data
+    output_filename = f"{ticker}_daily_adjusted_processed.parquet"
+    logger.info(f"Saving processed data for {ticker} to {output_filename}...")
+
+    if save_data(processed_df, output_filename, directory="data"):
+        logger.info(f"Successfully saved processed data for {ticker}.")
 
         # Optional: Demonstrate loading the data back
-        logging.info(f"Attempting to load saved data for {ticker} for verification...")
-        loaded_df = load_data_from_csv(output_filename, directory="data")
+        logger.info(f"Attempting to load saved data for {ticker} for verification...")
+        loaded_df = load_data(output_filename, directory="data")
         if loaded_df is not None:
-            logging.info(f"Successfully loaded data for {ticker} from CSV. Shape: {loaded_df.shape}")
-            logging.debug(f"Loaded data head for {ticker}:\n{loaded_df.head()}")
+            logger.info(f"Successfully loaded data for {ticker} from Parquet. Shape: {loaded_df.shape}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Loaded data head for %s:\n%s", ticker, loaded_df.head())
             # You can add more checks here, e.g., pd.testing.assert_frame_equal(processed_df, loaded_df)
             # Note: Floating point precision and timezone handling can sometimes make exact equality tricky.
             # For timezone, ensure both are UTC or handle comparison carefully.
             if processed_df.shape == loaded_df.shape: # Basic check
-                 logging.info(f"Shape of processed_df {processed_df.shape} matches loaded_df {loaded_df.shape}")
+                 logger.info(f"Shape of processed_df {processed_df.shape} matches loaded_df {loaded_df.shape}")
             else:
-                 logging.warning(f"Shape mismatch! Processed: {processed_df.shape}, Loaded: {loaded_df.shape}")
+                 logger.warning(f"Shape mismatch! Processed: {processed_df.shape}, Loaded: {loaded_df.shape}")
 
         else:
-            logging.warning(f"Could not load data back for {ticker} for verification.")
+            logger.warning(f"Could not load data back for {ticker} for verification.")
     else:
-        logging.error(f"Failed to save processed data for {ticker}.")
+        logger.error(f"Failed to save processed data for {ticker}.")
 
-    logging.info(f"--- Pipeline finished for {ticker} ---")
+    logger.info(f"--- Pipeline finished for {ticker} ---")
 
 
 if __name__ == "__main__":
     # Check if the API key is set
     if POLYGON_API_KEY == "YOUR_POLYGON_API_KEY":
-        logging.error("CRITICAL: POLYGON_API_KEY is not set in config.py. Please set your API key.")
-        logging.error("The application will not run without a valid API key.")
+        logger.error("CRITICAL: POLYGON_API_KEY is not set in config.py. Please set your API key.")
+        logger.error("The application will not run without a valid API key.")
     else:
         # You can run the pipeline for one or more tickers
         tickers_to_process = [DEFAULT_TICKER, "MSFT"] # Example: Apple and Microsoft
@@ -81,9 +95,18 @@ if __name__ == "__main__":
         # Ensure end_date is not in the future if Polygon API has restrictions for free tier
         end = DEFAULT_END_DATE 
 
-        for t in tickers_to_process:
-            run_pipeline(ticker=t, start_date=start, end_date=end, api_key=POLYGON_API_KEY)
-            logging.info("\n") # Add a newline for better readability between tickers
-
-        logging.info("All specified pipelines have completed.")
+        # fetch_stock_data is dominated by HTTPS round-trips and the GIL is
+        # released during socket I/O, so running tickers on a thread pool
+        # gives near-linear speedup up to the rate limit.
+        max_workers = min(MAX_PIPELINE_WORKERS, len(tickers_to_process))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(run_pipeline, ticker=t, start_date=start,
+                                end_date=end, api_key=POLYGON_API_KEY)
+                for t in tickers_to_process
+            ]
+            for future in futures:
+                future.result()  # Propagate any unexpected pipeline errors
+
+        logger.info("All specified pipelines have completed.")
 
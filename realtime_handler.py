@@ -0,0 +1,370 @@
+# realtime_handler.py
+
+import asyncio
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import logging
+from collections import namedtuple
+
+# orjson decodes JSON in SIMD-accelerated C, a large win at high message
+# rates; fall back to the stdlib if it isn't installed.
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
+import websockets
+
+# Configure basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Polygon.io real-time stocks WebSocket endpoint
+POLYGON_WS_URL = "wss://socket.polygon.io/stocks"
+
+# Number of trades coalesced per callback invocation. Dispatching per batch
+# amortizes callback and scheduling overhead on busy symbols.
+TRADE_BATCH_SIZE = 256
+
+# Flush partially-filled batches at least this often (seconds) while streaming
+BATCH_FLUSH_INTERVAL = 1.0
+
+# Bounded frame queue between the socket reader and the dispatch consumers;
+# frames are dropped (and counted) rather than backpressuring the socket.
+STREAM_QUEUE_MAXSIZE = 4096
+
+# Consumer tasks draining the frame queue
+STREAM_CONSUMERS = 4
+
+# Fixed Arrow schema for persisted trade files; matches the SoA buffer layout
+_TRADE_SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('ms', tz='UTC')),
+    ('price', pa.float64()),
+    ('size', pa.int32()),
+    ('exchange', pa.int16()),
+])
+
+# Lightweight record passed to trade callbacks; cheaper than a per-trade dict.
+Trade = namedtuple('Trade', ['ticker', 'timestamp', 'price', 'size', 'exchange'])
+
+# Initial per-ticker buffer capacity; buffers double when full.
+DEFAULT_BUFFER_CAPACITY = 4096
+
+
+class RealTimeDataHandler:
+    """
+    Buffers real-time trade messages (e.g., from the Polygon.io WebSocket feed)
+    per ticker and exposes them as Pandas DataFrames.
+
+    Trades are stored in a Struct-of-Arrays layout: one preallocated NumPy
+    array per field (timestamp, price, size, exchange) with a write cursor,
+    doubling capacity on overflow. This keeps appends O(1) and avoids building
+    one Python dict per trade, and get_buffer_data can wrap the arrays in a
+    DataFrame without per-row conversion.
+    """
+
+    def __init__(self, tickers: list[str] | None = None,
+                 buffer_capacity: int = DEFAULT_BUFFER_CAPACITY,
+                 on_trades=None, batch_size: int = TRADE_BATCH_SIZE):
+        """
+        Args:
+            tickers (list[str] | None): Tickers to preallocate buffers for.
+                                        Buffers for unseen tickers are created lazily.
+            buffer_capacity (int): Initial capacity of each per-ticker buffer.
+            on_trades (callable | None): Optional callback invoked with a list
+                                         of Trade namedtuples. Called once per
+                                         full batch (see batch_size) rather
+                                         than once per trade.
+            batch_size (int): Number of trades to coalesce per on_trades call.
+        """
+        self._initial_capacity = buffer_capacity
+        self._on_trades = on_trades
+        self._batch_size = batch_size
+        self._pending: dict[str, list[Trade]] = {}
+        self._buffers: dict[str, dict] = {}
+        self._writers: dict[str, pq.ParquetWriter] = {}
+        for ticker in (tickers or []):
+            self._buffers[ticker] = self._new_buffer(buffer_capacity)
+
+    def _new_buffer(self, capacity: int) -> dict:
+        """Allocates an empty Struct-of-Arrays trade buffer."""
+        return {
+            'ts': np.empty(capacity, dtype='int64'),    # UNIX ms (UTC)
+            'price': np.empty(capacity, dtype='float64'),
+            'size': np.empty(capacity, dtype='int32'),
+            'exchange': np.empty(capacity, dtype='int16'),
+            'n': 0,
+            'cap': capacity,
+            'flushed': 0,  # trades up to this cursor are already on disk
+        }
+
+    def _grow(self, buf: dict):
+        """Doubles the capacity of a full buffer, preserving its contents."""
+        new_cap = buf['cap'] * 2
+        for key in ('ts', 'price', 'size', 'exchange'):
+            grown = np.empty(new_cap, dtype=buf[key].dtype)
+            grown[:buf['n']] = buf[key][:buf['n']]
+            buf[key] = grown
+        buf['cap'] = new_cap
+        logger.debug("Grew trade buffer to capacity %d.", new_cap)  # lazy: hot path
+
+    def handle_message(self, message: dict):
+        """
+        Handles a single trade message from the WebSocket feed.
+
+        Expects Polygon.io trade event fields: 'sym' (ticker), 't' (UNIX ms
+        timestamp), 'p' (price), 's' (size), 'x' (exchange id).
+
+        Args:
+            message (dict): A decoded trade event.
+        """
+        # Trade events always carry these fields; index directly and dispatch
+        # through a single dict lookup rather than .get plus membership tests
+        # — one hash per message matters at tick rates.
+        try:
+            ticker = message['sym']
+        except KeyError:
+            logger.warning(f"Received message without a ticker symbol: {message}")
+            return
+
+        try:
+            buf = self._buffers[ticker]
+        except KeyError:
+            buf = self._buffers[ticker] = self._new_buffer(self._initial_capacity)
+
+        i = buf['n']
+        if i == buf['cap']:
+            self._grow(buf)
+
+        # Timestamps stay raw int64 ms here; get_buffer_data converts the
+        # whole column once, instead of allocating a Timestamp per trade.
+        buf['ts'][i] = int(message['t'])
+        buf['price'][i] = float(message['p'])
+        buf['size'][i] = int(message.get('s', 0))
+        buf['exchange'][i] = int(message.get('x', -1))
+        buf['n'] = i + 1
+
+        if self._on_trades is not None:
+            batch = self._pending.setdefault(ticker, [])
+            batch.append(Trade(ticker, buf['ts'][i], buf['price'][i],
+                               buf['size'][i], buf['exchange'][i]))
+            if len(batch) >= self._batch_size:
+                self._pending[ticker] = []
+                self._on_trades(batch)
+
+    def flush(self):
+        """
+        Dispatches all partially-filled trade batches to the callback.
+        Called periodically by start_streaming and on stream shutdown so
+        trades never sit in a batch indefinitely.
+        """
+        if self._on_trades is None:
+            return
+        for ticker, batch in self._pending.items():
+            if batch:
+                self._pending[ticker] = []
+                self._on_trades(batch)
+
+    def get_buffer_data(self, ticker: str) -> pd.DataFrame | None:
+        """
+        Returns the buffered trades for a ticker as a DataFrame.
+
+        The DataFrame wraps views of the underlying arrays (no per-row copy)
+        with a UTC DatetimeIndex.
+
+        Args:
+            ticker (str): The ticker symbol to snapshot.
+
+        Returns:
+            pd.DataFrame | None: Buffered trades, or None if nothing is buffered.
+        """
+        buf = self._buffers.get(ticker)
+        if buf is None or buf['n'] == 0:
+            logger.warning(f"No buffered trades for {ticker}.")
+            return None
+
+        n = buf['n']
+        df = pd.DataFrame({
+            'price': buf['price'][:n],
+            'size': buf['size'][:n],
+            'exchange': buf['exchange'][:n],
+        }, index=pd.to_datetime(buf['ts'][:n], unit='ms', utc=True),
+            copy=False)  # wrap the typed buffer views; no per-row inference or copy
+        df.index.name = 'timestamp'
+        return df
+
+    async def start_streaming(self, api_key: str, tickers: list[str],
+                              url: str = POLYGON_WS_URL):
+        """
+        Connects to the Polygon.io WebSocket feed, subscribes to trades for
+        the given tickers, and routes every trade event into the buffers.
+
+        The socket read loop (recv + orjson decode) is a dedicated producer
+        that only enqueues decoded frames, so a slow callback can never
+        backpressure the socket and fill the kernel buffer during bursts;
+        consumer tasks drain the queue and run handle_message. When the
+        bounded queue is full, frames are dropped and counted rather than
+        stalling the reader.
+
+        Args:
+            api_key (str): Your Polygon.io API key.
+            tickers (list[str]): Tickers to subscribe to (trade events).
+            url (str): WebSocket endpoint to connect to.
+        """
+        subscriptions = ",".join(f"T.{t}" for t in tickers)
+        logger.info(f"Connecting to {url} for trades: {subscriptions}")
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_MAXSIZE)
+        dropped = 0
+
+        async def producer(ws):
+            nonlocal dropped
+            async for raw in ws:
+                try:
+                    # Polygon delivers a JSON array of events per frame
+                    events = _json_loads(raw)
+                except ValueError as e:
+                    # Covers orjson.JSONDecodeError and json.JSONDecodeError;
+                    # one undecodable frame must not end the whole session
+                    logger.error(f"Undecodable frame from stream: {e}")
+                    continue
+                try:
+                    queue.put_nowait(events)
+                except asyncio.QueueFull:
+                    dropped += 1
+                    if dropped == 1 or dropped % 1000 == 0:
+                        logger.warning(f"Frame queue full; {dropped} frames dropped so far.")
+
+        async def consumer():
+            while True:
+                events = await queue.get()
+                # A malformed frame or event costs a log line, not a consumer
+                # task — a dead consumer silently sheds load and stalls
+                # queue.join() at shutdown — and task_done() must run no
+                # matter how processing fails, for the same reason.
+                try:
+                    for event in events:
+                        try:
+                            if event.get('ev') == 'T':
+                                self.handle_message(event)
+                            elif event.get('ev') == 'status':
+                                logger.info(f"Stream status: {event.get('message')}")
+                        except Exception as e:
+                            logger.error(f"Error handling stream event {event}: {e}")
+                except Exception as e:
+                    # e.g. a frame that decoded to a non-iterable JSON value
+                    logger.error(f"Error processing stream frame {events!r}: {e}")
+                finally:
+                    queue.task_done()
+
+        async def flusher():
+            # Flush partial batches so quiet tickers still see trades
+            while True:
+                await asyncio.sleep(BATCH_FLUSH_INTERVAL)
+                self.flush()
+
+        async with websockets.connect(url) as ws:
+            await ws.send(f'{{"action":"auth","params":"{api_key}"}}')
+            await ws.send(f'{{"action":"subscribe","params":"{subscriptions}"}}')
+
+            tasks = [asyncio.create_task(consumer()) for _ in range(STREAM_CONSUMERS)]
+            tasks.append(asyncio.create_task(flusher()))
+            try:
+                await producer(ws)
+                await queue.join()  # Drain whatever the producer enqueued
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                self.flush()
+
+    def flush_to_parquet(self, ticker: str, directory: str = "data") -> int:
+        """
+        Appends the trades buffered since the last flush to an on-disk
+        Parquet file for the ticker.
+
+        Uses a persistent pyarrow ParquetWriter per ticker, so each call
+        writes only the new [flushed:n] slice as a fresh row group instead of
+        rewriting the cumulative buffer — O(N) total serialization over the
+        life of the stream rather than O(N^2).
+
+        Args:
+            ticker (str): The ticker whose buffer to persist.
+            directory (str): Directory for the Parquet files.
+
+        Returns:
+            int: Number of trades written by this call.
+        """
+        buf = self._buffers.get(ticker)
+        if buf is None:
+            return 0
+        start, n = buf['flushed'], buf['n']
+        if n == start:
+            return 0
+
+        writer = self._writers.get(ticker)
+        if writer is None:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            path = os.path.join(directory, f"{ticker}_trades.parquet")
+            writer = pq.ParquetWriter(path, _TRADE_SCHEMA)
+            self._writers[ticker] = writer
+            logger.info(f"Opened incremental trade writer: {path}")
+
+        table = pa.Table.from_arrays([
+            pa.array(buf['ts'][start:n], type=_TRADE_SCHEMA.field('timestamp').type),
+            pa.array(buf['price'][start:n]),
+            pa.array(buf['size'][start:n]),
+            pa.array(buf['exchange'][start:n]),
+        ], schema=_TRADE_SCHEMA)
+        writer.write_table(table)
+        buf['flushed'] = n
+        return n - start
+
+    def close(self):
+        """
+        Flushes pending callback batches and unwritten trades, then closes
+        all Parquet writers. Call when streaming is done.
+        """
+        self.flush()
+        for ticker in list(self._writers):
+            self.flush_to_parquet(ticker)
+        for ticker, writer in self._writers.items():
+            writer.close()
+            logger.info(f"Closed trade writer for {ticker}.")
+        self._writers.clear()
+
+    def clear_buffer(self, ticker: str):
+        """Resets the buffer for a ticker without releasing its arrays."""
+        buf = self._buffers.get(ticker)
+        if buf is not None:
+            buf['n'] = 0
+            buf['flushed'] = 0
+
+
+if __name__ == '__main__':
+    # This is for testing the realtime_handler.py module directly
+    print("Testing realtime_handler.py...")
+    handler = RealTimeDataHandler(tickers=["AAPL"], buffer_capacity=4)
+
+    # Simulate a few Polygon-style trade messages (forces one buffer growth)
+    sample_messages = [
+        {'ev': 'T', 'sym': 'AAPL', 't': 1672578000000 + i * 1000,
+         'p': 150.0 + i * 0.05, 's': 100 + i, 'x': 4}
+        for i in range(6)
+    ]
+    for msg in sample_messages:
+        handler.handle_message(msg)
+
+    snapshot = handler.get_buffer_data("AAPL")
+    if snapshot is not None:
+        print("\nBuffered trades for AAPL:")
+        print(snapshot)
+        print(f"\nData types:\n{snapshot.dtypes}")
+    else:
+        print("No data buffered for AAPL.")